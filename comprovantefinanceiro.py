@@ -1,80 +1,29 @@
 import streamlit as st
-import pdfplumber
 import zipfile
 import io
+import hashlib
+import multiprocessing
 import os
-import re
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from pathlib import Path
-import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
+from extracao_comprovante import VERSAO_EXTRACAO, extrair_info_comprovante
 
-def extrair_info_comprovante(pdf_path):
-    """
-    Extrai data e nome do destinatário/beneficiário do comprovante PDF
-    Suporta comprovantes de Boleto, PIX e TED
-    """
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            # Extrair texto da primeira página
-            primeira_pagina = pdf.pages[0]
-            texto = primeira_pagina.extract_text()
-
-            data = None
-            destinatario = None
-            tipo_comprovante = None
-
-            # Detectar tipo de comprovante
-            if 'Boleto' in texto or 'Data de débito:' in texto:
-                tipo_comprovante = 'Boleto'
-
-                # Extrair data de débito (Boleto)
-                match_data = re.search(r'Data de débito:\s*(\d{2}/\d{2}/\d{4})', texto)
-                if match_data:
-                    data_str = match_data.group(1)
-                    data = data_str.replace('/', '-')
-
-                # Extrair nome do beneficiário (Boleto)
-                match_beneficiario = re.search(r'Nome do beneficiário:\s*(.+?)(?:\n|$)', texto)
-                if match_beneficiario:
-                    destinatario = match_beneficiario.group(1).strip()
-
-            elif 'TED' in texto and 'Transferência' in texto:
-                tipo_comprovante = 'TED'
-
-                # Extrair data/hora (TED) - pegar só a data
-                match_data = re.search(r'Data/Hora:\s*(\d{2}/\d{2}/\d{4})', texto)
-                if match_data:
-                    data_str = match_data.group(1)
-                    data = data_str.replace('/', '-')
-
-                # Extrair nome do favorecido (TED)
-                # Procurar após "Informações da Transferência"
-                match_favorecido = re.search(r'Favorecido:\s*(.+?)(?:\n|$)', texto)
-                if match_favorecido:
-                    destinatario = match_favorecido.group(1).strip()
-
-            elif 'PIX' in texto:
-                tipo_comprovante = 'PIX'
-
-                # Extrair data/hora (PIX) - pegar só a data
-                match_data = re.search(r'Data/Hora:\s*(\d{2}/\d{2}/\d{4})', texto)
-                if match_data:
-                    data_str = match_data.group(1)
-                    data = data_str.replace('/', '-')
-
-                # Extrair nome do destinatário (PIX)
-                # Procurar após "Informações do Destinatário"
-                match_destinatario = re.search(r'Informações do Destinatário.*?Nome:\s*(.+?)(?:\n|CPF)', texto,
-                                               re.DOTALL)
-                if match_destinatario:
-                    destinatario = match_destinatario.group(1).strip()
-
-            return data, destinatario, tipo_comprovante
-
-    except Exception as e:
-        st.error(f"Erro ao processar PDF: {str(e)}")
-        return None, None, None
+# Tabela de remoção dos caracteres não permitidos em nomes de arquivo
+TABELA_NOME_ARQUIVO = str.maketrans('', '', '<>:"/\\|?*')
+# Máximo de comprovantes mantidos no cache de extrações, compartilhado entre as sessões
+CACHE_EXTRACOES_MAX = 5000
+# Início dos processos de trabalho: forkserver onde existe (Linux, macOS), spawn no Windows.
+# Nunca fork: o servidor do Streamlit tem várias threads e o processo filho herdaria locks presos
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    CONTEXTO_PROCESSOS = multiprocessing.get_context('forkserver')
+    # Cada processo de trabalho importa este script de novo ao iniciar: com o streamlit e o pypdf
+    # já carregados no servidor de processos, ele os herda no fork em vez de importá-los
+    CONTEXTO_PROCESSOS.set_forkserver_preload(['streamlit', 'extracao_comprovante'])
+else:
+    CONTEXTO_PROCESSOS = multiprocessing.get_context('spawn')
 
 
 def limpar_nome_arquivo(nome):
@@ -82,97 +31,189 @@ def limpar_nome_arquivo(nome):
     Remove caracteres inválidos do nome do arquivo
     """
     # Remove caracteres que não são permitidos em nomes de arquivo
-    nome_limpo = re.sub(r'[<>:"/\\|?*]', '', nome)
+    nome_limpo = nome.translate(TABELA_NOME_ARQUIVO)
     # Remove espaços extras
     nome_limpo = ' '.join(nome_limpo.split())
     return nome_limpo
 
 
-def processar_zip(zip_file):
+def nome_unico(nome, usados):
     """
-    Processa o arquivo ZIP com comprovantes e retorna novo ZIP renomeado
+    Retorna um nome ainda não usado no ZIP de saída, acrescentando " (2)", " (3)"... se necessário
+    A comparação ignora maiúsculas/minúsculas, como no Windows e no macOS; o nome escolhido é
+    registrado em usados
     """
-    resultados = []
+    base, extensao = os.path.splitext(nome)
+    candidato = nome
+    numero = 1
+    while candidato.lower() in usados:
+        numero += 1
+        candidato = f"{base} ({numero}){extensao}"
 
-    # Criar diretório temporário
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_path = Path(temp_dir)
+    usados.add(candidato.lower())
+    return candidato
 
-        # Extrair arquivos do ZIP
-        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-            zip_ref.extractall(temp_path)
 
-        # Processar cada PDF
-        pdf_files = list(temp_path.rglob('*.pdf'))
+class CacheLRU:
+    """
+    Dicionário limitado que descarta as entradas usadas há mais tempo
+    Protegido por lock: a mesma instância é usada pelas sessões em threads diferentes
+    """
 
-        if not pdf_files:
-            st.warning("Nenhum arquivo PDF encontrado no ZIP.")
-            return None, []
+    def __init__(self, capacidade):
+        self.capacidade = capacidade
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
 
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+    def get(self, chave, padrao=None):
+        with self._lock:
+            if chave not in self._itens:
+                return padrao
+            self._itens.move_to_end(chave)
+            return self._itens[chave]
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            if len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+
+@st.cache_resource(show_spinner=False)
+def cache_extracoes():
+    """
+    Cache de extrações, indexado por (VERSAO_EXTRACAO, hash do conteúdo do PDF)
+    Uma única instância por servidor, compartilhada entre as sessões
+    """
+    return CacheLRU(CACHE_EXTRACOES_MAX)
 
-        arquivos_renomeados = []
 
-        for idx, pdf_file in enumerate(pdf_files):
-            status_text.text(f"Processando {pdf_file.name}...")
+def listar_pdfs_zip(zip_in):
+    """
+    Lista as entradas PDF do ZIP, inclusive as de subpastas, numa única passada pelo índice do arquivo
+    Ignora diretórios e os metadados que o macOS grava em __MACOSX/
+    """
+    return [info for info in zip_in.infolist()
+            if not info.is_dir()
+            and info.filename.lower().endswith('.pdf')
+            and not info.filename.startswith('__MACOSX/')]
+
+
+def processar_zip(zip_file, compactar=False):
+    """
+    Processa o arquivo ZIP com comprovantes e retorna novo ZIP renomeado
+    Os PDFs são lidos do ZIP e gravados no novo ZIP em memória, sem passar pelo disco
+    Por padrão os PDFs são apenas armazenados: eles já são compactados internamente
+    """
+    # Resultados em colunas: o st.dataframe monta a tabela direto a partir das listas
+    resultados = {'original': [], 'novo_nome': [], 'status': [], 'tipo': [], 'data': [], 'destinatario': []}
 
-            # Extrair informações
-            data, destinatario, tipo = extrair_info_comprovante(pdf_file)
+    compressao = zipfile.ZIP_DEFLATED if compactar else zipfile.ZIP_STORED
 
-            if data and destinatario:
-                # Criar novo nome
-                destinatario_limpo = limpar_nome_arquivo(destinatario)
-                novo_nome = f"{data} - {destinatario_limpo}.pdf"
+    # Sem pré-alocação: o BytesIO já cresce com sobrealocação e o getvalue() final
+    # reaproveita o buffer interno em vez de copiá-lo
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_file, 'r') as zip_in, zipfile.ZipFile(zip_buffer, 'w', compressao) as zip_out:
+        # Processar cada PDF
+        pdf_infos = listar_pdfs_zip(zip_in)
 
-                # Caminho do arquivo renomeado
-                novo_caminho = temp_path / novo_nome
+        if not pdf_infos:
+            st.warning("Nenhum arquivo PDF encontrado no ZIP.")
+            return None, resultados
 
-                # Renomear arquivo
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+
+        # Cada atualização da interface é uma ida e volta ao navegador: atualizar ~20 vezes no total
+        total = len(pdf_infos)
+        passo = max(1, total // 20)
+
+        # Informações já extraídas, indexadas pelo hash do conteúdo do PDF e compartilhadas
+        # entre as sessões: comprovantes reenviados não são lidos de novo
+        cache = cache_extracoes()
+
+        # Nomes já gravados no novo ZIP, para não sobrescrever comprovantes com mesma data e destinatário
+        nomes_usados = set()
+
+        # Extrair as informações em paralelo: cada PDF é independente e o parsing é CPU-bound.
+        # Com forkserver e spawn os processos só são iniciados à medida que há PDFs submetidos,
+        # até um por núcleo: nenhum é iniciado se todos os PDFs já estiverem no cache.
+        # Os resultados são consumidos na ordem original, e a gravação fica no processo principal.
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=CONTEXTO_PROCESSOS) as executor:
+            # Submeter cada PDF que ainda não está no cache assim que é lido do ZIP: a leitura
+            # dos próximos se sobrepõe ao parsing dos anteriores nos processos de trabalho.
+            # Os resultados do cache são copiados em conhecidos: outra sessão pode descartá-los
+            # antes de serem usados abaixo
+            entradas = []
+            conhecidos = {}
+            futuros = {}
+            for info in pdf_infos:
+                conteudo = zip_in.read(info)
+                chave = (VERSAO_EXTRACAO, hashlib.blake2b(conteudo, digest_size=16).digest())
+                if chave not in conhecidos and chave not in futuros:
+                    valor = cache.get(chave)
+                    if valor is None:
+                        futuros[chave] = executor.submit(extrair_info_comprovante, conteudo)
+                    else:
+                        conhecidos[chave] = valor
+                entradas.append((info, conteudo, chave))
+
+            for idx, (info, conteudo, chave) in enumerate(entradas):
+                nome_original = os.path.basename(info.filename)
+
+                # Extrair informações
                 try:
-                    pdf_file.rename(novo_caminho)
-                    arquivos_renomeados.append(novo_caminho)
-                    resultados.append({
-                        'original': pdf_file.name,
-                        'novo_nome': novo_nome,
-                        'status': '✅ Sucesso',
-                        'tipo': tipo or 'Desconhecido',
-                        'data': data,
-                        'destinatario': destinatario_limpo
-                    })
+                    if chave not in conhecidos:
+                        conhecidos[chave] = futuros[chave].result()
+                        cache.set(chave, conhecidos[chave])
+                    data, destinatario, tipo = conhecidos[chave]
                 except Exception as e:
-                    resultados.append({
-                        'original': pdf_file.name,
-                        'novo_nome': '-',
-                        'status': f'❌ Erro ao renomear: {str(e)}',
-                        'tipo': tipo or 'Desconhecido',
-                        'data': data,
-                        'destinatario': destinatario_limpo
-                    })
-            else:
-                resultados.append({
-                    'original': pdf_file.name,
-                    'novo_nome': '-',
-                    'status': '⚠️ Informações não encontradas',
-                    'tipo': tipo or 'Desconhecido',
-                    'data': data or 'N/A',
-                    'destinatario': destinatario or 'N/A'
-                })
-
-            progress_bar.progress((idx + 1) / len(pdf_files))
+                    st.error(f"Erro ao processar PDF: {str(e)}")
+                    data, destinatario, tipo = None, None, None
+
+                if data and destinatario:
+                    # Criar novo nome
+                    destinatario_limpo = limpar_nome_arquivo(destinatario)
+                    novo_nome = nome_unico(f"{data} - {destinatario_limpo}.pdf", nomes_usados)
+
+                    # Gravar os bytes já lidos direto no novo ZIP com o novo nome,
+                    # mantendo a data e os atributos da entrada original. O create_system vai junto:
+                    # os atributos de um ZIP do Windows, lidos como permissões Unix, zeram o modo do arquivo
+                    entrada = zipfile.ZipInfo(novo_nome, date_time=info.date_time)
+                    entrada.create_system = info.create_system
+                    entrada.external_attr = info.external_attr
+                    entrada.compress_type = compressao
+                    try:
+                        zip_out.writestr(entrada, conteudo)
+                        status = '✅ Sucesso'
+                    except Exception as e:
+                        novo_nome = '-'
+                        status = f'❌ Erro ao renomear: {str(e)}'
+                    destinatario = destinatario_limpo
+                else:
+                    novo_nome = '-'
+                    status = '⚠️ Informações não encontradas'
+                    data = data or 'N/A'
+                    destinatario = destinatario or 'N/A'
+
+                resultados['original'].append(nome_original)
+                resultados['novo_nome'].append(novo_nome)
+                resultados['status'].append(status)
+                resultados['tipo'].append(tipo or 'Desconhecido')
+                resultados['data'].append(data)
+                resultados['destinatario'].append(destinatario)
+
+                if (idx + 1) % passo == 0 or idx + 1 == total:
+                    progress_bar.progress((idx + 1) / total)
+                    status_text.text(f"Processando {idx + 1}/{total}...")
 
         status_text.text("Criando arquivo ZIP final...")
 
-        # Criar novo ZIP com arquivos renomeados
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_out:
-            for arquivo in arquivos_renomeados:
-                zip_out.write(arquivo, arquivo.name)
-
-        progress_bar.progress(1.0)
-        status_text.text("Processamento concluído!")
+    progress_bar.progress(1.0)
+    status_text.text("Processamento concluído!")
 
-        return zip_buffer.getvalue(), resultados
+    return zip_buffer.getvalue(), resultados
 
 
 def main():
@@ -203,20 +244,27 @@ def main():
     if uploaded_file is not None:
         st.success(f"Arquivo carregado: {uploaded_file.name}")
 
+        compactar = st.checkbox(
+            "Compactar o ZIP de saída",
+            value=False,
+            help="Os PDFs já são compactados internamente; compactar de novo deixa o processamento mais lento "
+                 "e quase não reduz o tamanho do arquivo"
+        )
+
         # Botão para processar
         if st.button("🚀 Processar Comprovantes", type="primary", use_container_width=True):
             with st.spinner("Processando comprovantes..."):
-                zip_output, resultados = processar_zip(uploaded_file)
+                zip_output, resultados = processar_zip(uploaded_file, compactar)
 
-            if zip_output and resultados:
+            if zip_output and resultados['original']:
                 st.divider()
                 st.subheader("2️⃣ Resultados do Processamento")
 
                 # Estatísticas
                 col1, col2, col3 = st.columns(3)
 
-                total = len(resultados)
-                sucesso = len([r for r in resultados if r['status'] == '✅ Sucesso'])
+                total = len(resultados['original'])
+                sucesso = resultados['status'].count('✅ Sucesso')
                 erro = total - sucesso
 
                 col1.metric("Total de Arquivos", total)
@@ -299,7 +347,7 @@ def main():
         - Caracteres especiais inválidos são removidos automaticamente
         - Espaços extras são normalizados
         - Para PIX e TED, apenas a data é usada (hora é descartada)
-        - Arquivos duplicados (mesmo destinatário e data) sobrescreverão uns aos outros
+        - Arquivos com mesmo destinatário e data recebem um sufixo numérico, como `(2)` e `(3)`
         """)
 
     st.divider()
@@ -0,0 +1,165 @@
+# Extração de data, destinatário e tipo dos comprovantes PDF, sem dependência da interface.
+# Fica num módulo próprio para que os processos de trabalho recebam extrair_info_comprovante
+# por um nome estável: o Streamlit recria o módulo __main__ a cada execução do script.
+# O pdfplumber é importado só no fallback, quando o texto do pypdf não basta
+import io
+
+import pypdf
+
+# Rótulos característicos de cada tipo de comprovante
+ROTULOS_TIPO = {
+    'Data de débito:': 'Boleto',
+    'Favorecido:': 'TED',
+    'Informações do Destinatário': 'PIX',
+}
+
+# Nome do destinatário PIX: buscado só numa janela logo após "Informações do Destinatário"
+PIX_JANELA = 400
+# Versão das regras de extração, parte da chave do cache de extrações: incrementar quando uma
+# mudança alterar os resultados, para que não sejam servidos resultados da versão anterior
+VERSAO_EXTRACAO = 1
+
+
+class _CamposEncontrados(Exception):
+    """
+    Interrompe a extração de texto do pypdf assim que data e destinatário já foram lidos
+    """
+
+
+def campo_apos(texto, rotulo, inicio=0, fim=None):
+    """
+    Retorna o restante da linha após o rótulo, sem espaços nas pontas
+    O rótulo é procurado em texto[inicio:fim]; retorna None se não for encontrado ou não tiver valor
+    """
+    posicao = texto.find(rotulo, inicio, fim)
+    if posicao < 0:
+        return None
+
+    valor = texto[posicao + len(rotulo):].lstrip().partition('\n')[0].strip()
+    # Uma linha terminada em ":" é outro rótulo, não o valor (rótulos e valores em colunas)
+    if not valor or valor.endswith(':'):
+        return None
+    return valor
+
+
+def data_apos(texto, rotulo):
+    """
+    Retorna a data DD/MM/AAAA que segue o rótulo já no formato DD-MM-AAAA
+    Retorna None se o rótulo não for encontrado ou não for seguido de uma data
+    """
+    valor = campo_apos(texto, rotulo)
+    if not valor:
+        return None
+
+    # A data tem largura fixa: basta conferir as barras e os dígitos
+    data_str = valor[:10]
+    if (len(data_str) == 10 and data_str[2] == '/' and data_str[5] == '/'
+            and data_str[:2].isdecimal() and data_str[3:5].isdecimal() and data_str[6:].isdecimal()):
+        return data_str.replace('/', '-')
+    return None
+
+
+def detectar_tipo_comprovante(texto):
+    """
+    Identifica o tipo de comprovante pelo rótulo característico que aparece primeiro no texto
+    Retorna (tipo_comprovante, posição do rótulo), ou (None, -1) se nenhum for encontrado
+    """
+    tipo_comprovante = None
+    inicio = -1
+
+    # Um str.find por rótulo: para três literais num texto de poucos KB é mais rápido
+    # que um autômato de Aho-Corasick ou uma alternância de literais no re ou no re2
+    for rotulo, tipo in ROTULOS_TIPO.items():
+        posicao = texto.find(rotulo)
+        if posicao >= 0 and (inicio < 0 or posicao < inicio):
+            tipo_comprovante, inicio = tipo, posicao
+
+    return tipo_comprovante, inicio
+
+
+def interpretar_texto_comprovante(texto):
+    """
+    Identifica o tipo de comprovante e extrai data e destinatário do texto já extraído
+    Retorna (data, destinatario, tipo_comprovante), com None nos campos não encontrados
+    """
+    data = None
+    destinatario = None
+
+    tipo_comprovante, inicio = detectar_tipo_comprovante(texto)
+
+    # Extrair só os campos do tipo detectado
+    if tipo_comprovante == 'Boleto':
+        # Boleto: "Data de débito" e "Nome do beneficiário"
+        data = data_apos(texto, 'Data de débito:')
+        destinatario = campo_apos(texto, 'Nome do beneficiário:')
+
+    elif tipo_comprovante == 'TED':
+        # TED: "Data/Hora" (só a data) e "Favorecido"
+        data = data_apos(texto, 'Data/Hora:')
+        destinatario = campo_apos(texto, 'Favorecido:')
+
+    elif tipo_comprovante == 'PIX':
+        # PIX: "Data/Hora" (só a data) e "Nome" logo após "Informações do Destinatário"
+        data = data_apos(texto, 'Data/Hora:')
+        destinatario = campo_apos(texto, 'Nome:', inicio, inicio + PIX_JANELA)
+        if destinatario:
+            # O CPF pode vir na mesma linha do nome
+            destinatario = destinatario.partition('CPF')[0].strip() or None
+
+    return data, destinatario, tipo_comprovante
+
+
+def extrair_texto_primeira_pagina(pdf_bytes):
+    """
+    Extrai o texto da primeira página do PDF, recebido como bytes, com o pypdf
+    O pypdf não faz análise de layout: o texto vem na ordem do PDF. A leitura da página
+    para assim que as linhas já lidas contêm data e destinatário
+    """
+    partes = []
+
+    def visitante(trecho, cm, tm, font_dict, font_size):
+        partes.append(trecho)
+        # Só avalia ao fechar uma linha, para não interpretar um nome pela metade
+        if '\n' in trecho:
+            lido = ''.join(partes)
+            data, destinatario, _ = interpretar_texto_comprovante(lido[:lido.rfind('\n')])
+            if data and destinatario:
+                raise _CamposEncontrados
+
+    try:
+        texto = pypdf.PdfReader(io.BytesIO(pdf_bytes)).pages[0].extract_text(visitor_text=visitante)
+    except _CamposEncontrados:
+        texto = ''.join(partes)
+
+    return texto or ''
+
+
+def extrair_texto_primeira_pagina_layout(pdf_bytes):
+    """
+    Extrai o texto da primeira página do PDF com o pdfplumber, que reconstrói as linhas visuais
+    Mais lento que o pypdf; usado quando o texto do pypdf não traz data e destinatário
+    """
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        return pdf.pages[0].extract_text() or ''
+
+
+def extrair_info_comprovante(pdf_bytes):
+    """
+    Extrai data e nome do destinatário/beneficiário do comprovante PDF, recebido como bytes
+    Suporta comprovantes de Boleto, PIX e TED
+    Executada em processos de trabalho: erros de leitura são propagados para quem chama
+    """
+    # Extrair texto da primeira página com o pypdf
+    try:
+        info = interpretar_texto_comprovante(extrair_texto_primeira_pagina(pdf_bytes))
+        data, destinatario, _ = info
+        if data and destinatario:
+            return info
+    except Exception:
+        pass
+
+    # O pypdf devolve o texto na ordem do PDF, que pode separar rótulos e valores
+    # (por exemplo, quando são desenhados em colunas): refazer com a análise de layout
+    return interpretar_texto_comprovante(extrair_texto_primeira_pagina_layout(pdf_bytes))
\ No newline at end of file